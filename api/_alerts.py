@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+阈值提醒引擎（长时间运行的服务器使用）
+规则按 (基金, 指标, 比较方式) 建立有序阈值索引，新值到来时只用二分查找
+取出「上一个值到新值之间被跨越」的阈值，触发一次后需回到阈值另一侧才会再次触发
+"""
+
+import bisect
+import itertools
+import operator
+import re
+import threading
+import time
+from collections import deque
+
+# 支持的指标（fetch_fund_valuation 结果中的字段）
+METRICS = ("estimate_change", "daily_change", "streak_days")
+# 比较方式：lt <、le <=、gt >、ge >=
+OPS = ("lt", "le", "gt", "ge")
+OP_FUNCS = {"lt": operator.lt, "le": operator.le, "gt": operator.gt, "ge": operator.ge}
+
+ALERT_EVENTS_SIZE = 1000        # 保留的最近提醒条数
+ALERT_POLL_INTERVAL = 60        # 后台刷新有规则基金估值的间隔（秒）
+ALERT_MAX_WAIT = 25             # 长轮询最长等待（秒）
+
+NUMBER_RE = re.compile(r'^\s*(-?\d+(?:\.\d+)?)')
+
+
+def parse_metric(value):
+    """'-2.13%'、'1.2%(2024-05-20)'、-3 等转为数值，无法解析（N/A）返回 None"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_RE.match(str(value))
+    return float(match.group(1)) if match else None
+
+
+class ThresholdIndex:
+    """同一 (基金, 指标, 比较方式) 下的有序阈值"""
+
+    def __init__(self, op):
+        self.op = op
+        self.thresholds = []
+        self.rule_ids = []
+
+    def add(self, threshold, rule_id):
+        i = bisect.bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(i, threshold)
+        self.rule_ids.insert(i, rule_id)
+
+    def remove(self, threshold, rule_id):
+        i = bisect.bisect_left(self.thresholds, threshold)
+        while i < len(self.thresholds) and self.thresholds[i] == threshold:
+            if self.rule_ids[i] == rule_id:
+                del self.thresholds[i]
+                del self.rule_ids[i]
+                return
+            i += 1
+
+    def crossed(self, prev, value):
+        """返回 prev -> value 时新满足条件的规则 id；prev 为 None 时所有满足条件的规则都触发"""
+        t = self.thresholds
+        if self.op == "lt":      # value < T <= prev
+            lo = bisect.bisect_right(t, value)
+            hi = len(t) if prev is None else bisect.bisect_right(t, prev)
+        elif self.op == "le":    # value <= T < prev
+            lo = bisect.bisect_left(t, value)
+            hi = len(t) if prev is None else bisect.bisect_left(t, prev)
+        elif self.op == "gt":    # prev <= T < value
+            lo = 0 if prev is None else bisect.bisect_left(t, prev)
+            hi = bisect.bisect_left(t, value)
+        else:                    # prev < T <= value
+            lo = 0 if prev is None else bisect.bisect_right(t, prev)
+            hi = bisect.bisect_right(t, value)
+        return self.rule_ids[lo:hi] if lo < hi else []
+
+
+class AlertEngine:
+    """规则存储、索引与提醒事件队列"""
+
+    def __init__(self, events_size=ALERT_EVENTS_SIZE):
+        self.rules = {}
+        self.index = {}          # (code, metric) -> {op: ThresholdIndex}
+        self.last = {}           # (code, metric) -> 上一个值
+        self.fund_keys = {}      # code -> fund_key，供后台刷新
+        self.events = deque(maxlen=events_size)
+        self.cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._seq = 0
+        self._thread = None
+
+    def add_rule(self, code, metric, op, threshold, fund_key="", note=""):
+        if metric not in METRICS:
+            raise ValueError(f"不支持的指标: {metric}")
+        if op not in OPS:
+            raise ValueError(f"不支持的比较方式: {op}")
+        threshold = float(threshold)
+        with self.cond:
+            rule_id = next(self._ids)
+            rule = {"id": rule_id, "code": code, "metric": metric, "op": op,
+                    "threshold": threshold, "note": note}
+            self.rules[rule_id] = rule
+            ops = self.index.setdefault((code, metric), {})
+            ops.setdefault(op, ThresholdIndex(op)).add(threshold, rule_id)
+            if fund_key:
+                self.fund_keys[code] = fund_key
+            # 已有该指标的最新值时，与新建引擎首次观测一致：当前已满足条件就立即触发
+            value = self.last.get((code, metric))
+            if value is not None and OP_FUNCS[op](value, threshold):
+                self._emit(rule, value, None)
+                self.cond.notify_all()
+            return rule
+
+    def remove_rule(self, rule_id):
+        with self.cond:
+            rule = self.rules.pop(rule_id, None)
+            if rule is None:
+                return False
+            key = (rule["code"], rule["metric"])
+            ops = self.index[key]
+            ops[rule["op"]].remove(rule["threshold"], rule_id)
+            if not ops[rule["op"]].thresholds:
+                del ops[rule["op"]]
+            if not ops:
+                del self.index[key]
+                self.last.pop(key, None)
+            return True
+
+    def list_rules(self, code=None):
+        with self.cond:
+            return [r for r in self.rules.values() if code is None or r["code"] == code]
+
+    def observe(self, valuation):
+        """处理一条 fetch_fund_valuation 结果，返回新触发的提醒"""
+        code = valuation.get("code")
+        fired = []
+        with self.cond:
+            for metric in METRICS:
+                key = (code, metric)
+                ops = self.index.get(key)
+                if not ops:
+                    continue
+                value = parse_metric(valuation.get(metric))
+                if value is None:
+                    continue
+                prev = self.last.get(key)
+                self.last[key] = value
+                if prev == value:
+                    continue
+                for index in ops.values():
+                    for rule_id in index.crossed(prev, value):
+                        fired.append(self._emit(self.rules[rule_id], value, valuation.get("estimate_time")))
+            if fired:
+                self.cond.notify_all()
+        return fired
+
+    def _emit(self, rule, value, estimate_time):
+        """追加一条提醒事件，调用方需持有 self.cond"""
+        self._seq += 1
+        event = {"seq": self._seq, "ts": int(time.time()), "rule": rule,
+                 "value": value, "estimate_time": estimate_time}
+        self.events.append(event)
+        return event
+
+    def poll(self, since=0, wait=0):
+        """返回 seq > since 的提醒；wait 秒内没有新提醒时阻塞等待（长轮询）"""
+        deadline = time.monotonic() + min(max(wait, 0), ALERT_MAX_WAIT)
+        with self.cond:
+            while self._seq <= since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            events = [e for e in self.events if e["seq"] > since]
+            return {"events": events, "cursor": self._seq}
+
+    def start(self, fetch_batch, interval=ALERT_POLL_INTERVAL):
+        """后台定时刷新有规则基金的估值；fetch_batch 接收 (code, fund_key) 列表"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                with self.cond:
+                    funds = [(code, self.fund_keys[code]) for code in {c for c, _ in self.index}
+                             if code in self.fund_keys]
+                if not funds:
+                    continue
+                try:
+                    fetch_batch(funds)
+                except Exception as e:
+                    print(f"刷新提醒基金估值失败: {e}")
+
+        self._thread = threading.Thread(target=loop, name="alert-poller", daemon=True)
+        self._thread.start()
+
+
+alert_engine = AlertEngine()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+JSON 编码
+安装了 orjson 时使用 orjson，否则回退到标准库；静态响应在导入时预编码
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps_stdlib(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _dumps_orjson(data):
+    return orjson.dumps(data)
+
+
+# 当前使用的编码器，可通过 set_encoder 替换
+dumps = _dumps_orjson if orjson else _dumps_stdlib
+ENCODER = "orjson" if orjson else "json"
+
+
+def set_encoder(name):
+    """切换编码器：'orjson' 或 'json'"""
+    global dumps, ENCODER
+    if name == "orjson" and orjson is None:
+        raise ImportError("orjson 未安装")
+    dumps = _dumps_orjson if name == "orjson" else _dumps_stdlib
+    ENCODER = name
+
+
+def encode(data):
+    """编码响应，已预编码的 bytes 原样返回"""
+    if isinstance(data, (bytes, bytearray)):
+        return data
+    return dumps(data)
+
+
+def preencode(data):
+    """导入时预编码静态响应"""
+    return _dumps_stdlib(data)
+
+
+EMPTY = preencode({})
+
+
+def to_columns(rows, dict_fields=()):
+    """
+    行对象列表转为列式结构：列名只出现一次，每列一个数组；
+    dict_fields 中的低基数字段做字典编码，列中存放字典下标
+    """
+    if not rows:
+        return {"columns": [], "values": [], "dicts": {}, "length": 0}
+    
+    columns = list(rows[0].keys())
+    values = []
+    dicts = {}
+    for name in columns:
+        column = [row.get(name) for row in rows]
+        if name in dict_fields:
+            index = {}
+            column = [index.setdefault(v, len(index)) for v in column]
+            dicts[name] = list(index)
+        values.append(column)
+    return {"columns": columns, "values": values, "dicts": dicts, "length": len(rows)}
+
+
+def from_columns(table):
+    """to_columns 的逆变换（与前端 decodeColumns 一致）"""
+    columns, values, dicts = table["columns"], table["values"], table["dicts"]
+    decoded = [[dicts[name][i] for i in col] if name in dicts else col
+               for name, col in zip(columns, values)]
+    return [dict(zip(columns, row)) for row in zip(*decoded)]
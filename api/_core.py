@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+三个 API 共用的轻量核心
+导入时只加载标准库，requests 等重模块在首次发起上游请求时才加载，缩短冷启动
+"""
+
+import _codec
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+CORS_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type'),
+)
+
+_requests = None
+
+
+def load_requests():
+    """首次调用时导入 requests 并关闭证书告警"""
+    global _requests
+    if _requests is None:
+        import requests
+        import urllib3
+        urllib3.disable_warnings()
+        _requests = requests
+    return _requests
+
+
+def new_session(headers=None):
+    """创建 requests.Session"""
+    session = load_requests().Session()
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def is_cacheable(data):
+    """预编码的 bytes 只用于成功响应；上游失败时返回的空列表不缓存"""
+    if isinstance(data, (bytes, bytearray)):
+        return True
+    return bool(data.get("success")) and data.get("data") not in ([], {}, None)
+
+
+def cache_control(max_age):
+    """浏览器与 CDN 共用的缓存头，过期后允许在后台刷新期间继续使用旧数据"""
+    if not max_age:
+        return 'no-store'
+    return f'public, max-age={max_age}, s-maxage={max_age}, stale-while-revalidate={max_age * 4}'
+
+
+def send_json(handler, data, status=200, max_age=0, headers=None):
+    """写出 JSON 响应，data 可以是预编码的 bytes；仅成功响应按 max_age 缓存"""
+    if status != 200 or not is_cacheable(data):
+        max_age = 0
+    handler.send_response(status)
+    handler.send_header('Content-Type', 'application/json; charset=utf-8')
+    handler.send_header('Cache-Control', cache_control(max_age))
+    for key, value in CORS_HEADERS:
+        handler.send_header(key, value)
+    for key, value in (headers or {}).items():
+        handler.send_header(key, value)
+    handler.end_headers()
+    handler.wfile.write(_codec.encode(data))
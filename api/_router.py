@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+统一路由核心
+fund/market/sector 的 action 注册到同一个路由表，Vercel handler 与 dev_server.py 共用
+参数校验、中间件（缓存、计时、截止时间、压缩）与响应输出
+"""
+
+import gzip
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import _codec
+import _core
+import _upstream as upstream
+from _upstream import UpstreamBusy, DeadlineExceeded
+
+DEFAULT_DEADLINE = 25           # 默认截止时间（秒），低于 Vercel 函数超时
+RESPONSE_CACHE_SIZE = 256       # 进程内响应缓存条数
+GZIP_MIN_SIZE = 1024            # 超过该大小且客户端支持时 gzip 压缩
+
+
+class Param:
+    """action 参数定义：类型转换、默认值、必填与格式校验"""
+
+    def __init__(self, name, type=str, default="", required=False, pattern=None, message=None, invalid=None):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.required = required
+        self.pattern = re.compile(pattern) if pattern else None
+        self.message = message or "缺少参数"
+        self.invalid = invalid or f"参数 {name} 无效"
+
+    def parse(self, query):
+        raw = query.get(self.name, [''])[0]
+        if not raw:
+            if self.required:
+                raise ValueError(self.message)
+            return self.default
+        if self.pattern and not self.pattern.match(raw):
+            raise ValueError(self.invalid)
+        try:
+            return self.type(raw)
+        except ValueError as e:
+            # int/float 等内置类型的报错不适合展示，自定义转换函数的报错原样返回
+            if isinstance(self.type, type) or not str(e):
+                raise ValueError(self.invalid)
+            raise
+
+
+def fund_pairs(raw):
+    """解析 code1:key1,code2:key2 形式的基金列表"""
+    funds = [tuple(item.split(':')) for item in raw.split(',')]
+    return [f for f in funds if len(f) == 2]
+
+
+class Route:
+    def __init__(self, endpoint, action, fn, params, max_age, columns, long_running):
+        self.endpoint = endpoint
+        self.action = action
+        self.fn = fn
+        self.params = params
+        self.max_age = max_age
+        self.columns = columns
+        self.long_running = long_running
+
+
+class Request:
+    def __init__(self, endpoint, action, query, headers=None, long_running=False):
+        self.endpoint = endpoint
+        self.action = action
+        self.query = query
+        self.headers = headers or {}      # 键为小写
+        self.long_running = long_running
+        self.route = None
+        self.args = {}
+
+
+class Response:
+    def __init__(self, data, status=200, max_age=0):
+        self.data = data
+        self.status = status
+        self.max_age = max_age
+        self.headers = {}
+
+
+class Router:
+    """action 路由表与中间件链"""
+
+    def __init__(self):
+        self.routes = {}
+        self.middleware = []
+
+    def action(self, endpoint, action, *params, max_age=0, columns=None, long_running=False):
+        """注册 action；columns 为 layout=columns 时做字典编码的字段，long_running 表示仅本地服务器可用"""
+        def decorator(fn):
+            self.routes[(endpoint, action)] = Route(endpoint, action, fn, params, max_age, columns, long_running)
+            return fn
+        return decorator
+
+    def use(self, middleware):
+        """添加中间件 middleware(request, call_next) -> Response，先添加的在外层"""
+        self.middleware.append(middleware)
+        return middleware
+
+    def _call(self, request):
+        route = request.route
+        try:
+            request.args = {p.name: p.parse(request.query) for p in route.params}
+            data = route.fn(**request.args)
+        except UpstreamBusy:
+            raise
+        except Exception as e:
+            return Response({"success": False, "message": str(e)})
+
+        max_age = route.max_age if _core.is_cacheable(data) else 0
+        layout = request.query.get('layout', [''])[0]
+        if layout == 'columns' and route.columns is not None and isinstance(data, dict) and data.get("data"):
+            data = {"success": True, "layout": "columns",
+                    "data": _codec.to_columns(data["data"], route.columns)}
+        return Response(data, max_age=max_age)
+
+    def dispatch(self, request):
+        route = self.routes.get((request.endpoint, request.action))
+        if route is None:
+            return Response({"success": False, "message": f"未知操作: {request.action}"})
+        if route.long_running and not request.long_running:
+            return Response({"success": False, "message": "该操作仅本地服务器支持"})
+        request.route = route
+
+        def call(i):
+            if i == len(self.middleware):
+                return self._call(request)
+            return self.middleware[i](request, lambda: call(i + 1))
+
+        try:
+            return call(0)
+        except DeadlineExceeded as e:
+            return Response({"success": False, "busy": True, "message": f"请求超时: {e}"}, 504)
+        except UpstreamBusy as e:
+            return Response({"success": False, "busy": True, "message": f"上游繁忙，请稍后重试: {e}"}, 503)
+        except Exception as e:
+            return Response({"success": False, "message": str(e)})
+
+
+router = Router()
+
+
+# ---- 中间件 ----
+
+class ResponseCache:
+    """进程内响应缓存：按 action 的 max_age 复用成功响应，正文只编码一次"""
+
+    def __init__(self, size=RESPONSE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __call__(self, request, call_next):
+        max_age = request.route.max_age
+        if not max_age:
+            return call_next()
+        key = (request.endpoint, request.action,
+               tuple(sorted((k, tuple(v)) for k, v in request.query.items())))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                response = Response(entry[1], max_age=max(1, int(entry[0] - now)))
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+        response = call_next()
+        if response.status == 200 and response.max_age:
+            response.data = _codec.encode(response.data)
+            with self.lock:
+                self.entries[key] = (now + max_age, response.data)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return response
+
+
+class Timing:
+    """记录每个 action 的次数与耗时，并通过 Server-Timing 头返回"""
+
+    def __init__(self):
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, request, call_next):
+        started = time.perf_counter()
+        response = call_next()
+        elapsed = (time.perf_counter() - started) * 1000
+        response.headers['Server-Timing'] = f'app;dur={elapsed:.1f}'
+        with self.lock:
+            stat = self.stats.setdefault(f"{request.endpoint}.{request.action}",
+                                         {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stat["count"] += 1
+            stat["total_ms"] = round(stat["total_ms"] + elapsed, 1)
+            stat["max_ms"] = round(max(stat["max_ms"], elapsed), 1)
+        return response
+
+
+def deadline(request, call_next):
+    """截止时间：deadline 参数（秒）或默认值，传递给上游调度器
+
+    默认值只用于 Vercel（受函数超时限制），本地服务器只在显式传入 deadline 时限制
+    """
+    raw = request.query.get('deadline', [''])[0]
+    try:
+        seconds = min(float(raw), DEFAULT_DEADLINE) if raw else None
+    except ValueError:
+        seconds = None
+    if seconds is None and not request.long_running:
+        seconds = DEFAULT_DEADLINE
+    if seconds is None:
+        return call_next()
+    with upstream.deadline(seconds):
+        return call_next()
+
+
+def compression(request, call_next):
+    """编码响应正文，客户端支持时对较大的正文做 gzip"""
+    response = call_next()
+    body = _codec.encode(response.data)
+    if len(body) >= GZIP_MIN_SIZE and 'gzip' in request.headers.get('accept-encoding', ''):
+        body = gzip.compress(body, compresslevel=5)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.data = body
+    return response
+
+
+timing = Timing()
+response_cache = ResponseCache()
+router.use(compression)
+router.use(timing)
+router.use(deadline)
+router.use(response_cache)
+
+
+@router.action("server", "metrics", long_running=True)
+def server_metrics():
+    """各 action 的调用次数与耗时"""
+    return {"success": True, "data": timing.stats}
+
+
+# ---- 入口 ----
+
+def handle(http_handler, endpoint, query, long_running=False):
+    """处理一次 HTTP 请求并写出响应，供 Vercel handler 与 dev_server 共用"""
+    params = parse_qs(query)
+    headers = getattr(http_handler, 'headers', None)
+    request = Request(endpoint, params.get('action', [''])[0], params,
+                      {k.lower(): v for k, v in headers.items()} if headers else {}, long_running)
+    response = router.dispatch(request)
+    _core.send_json(http_handler, response.data, response.status, response.max_age, response.headers)
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Vercel Serverless Function 入口，子类设置 endpoint"""
+
+    endpoint = ""
+
+    def do_OPTIONS(self):
+        _core.send_json(self, _codec.EMPTY)
+
+    def do_GET(self):
+        handle(self, self.endpoint, urlparse(self.path).query)
+
+    def do_POST(self):
+        self.do_GET()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+上游录制/回放
+record 模式把上游响应（URL、参数、正文、耗时）追加到 gzip JSON Lines 存档，
+replay 模式从存档返回响应，可按原始耗时或尽快回放，用于离线开发与可复现的性能测试
+
+环境变量：
+    FUND_UPSTREAM_MODE     live（默认）/ record / replay
+    FUND_UPSTREAM_ARCHIVE  存档路径，默认 upstream_archive.jsonl.gz
+    FUND_REPLAY_TIMING     original（按录制耗时）/ fast（默认）
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+
+LIVE = "live"
+RECORD = "record"
+REPLAY = "replay"
+
+DEFAULT_ARCHIVE = "upstream_archive.jsonl.gz"
+
+# 每次请求都会变化的参数，不参与匹配
+VOLATILE_KEYS = {"rnd", "_csrf", "startTime", "endTime"}
+
+
+class ReplayMiss(Exception):
+    """存档中没有匹配的请求"""
+
+
+class ReplayResponse:
+    """回放的响应，提供 fetcher 用到的 requests.Response 接口"""
+
+    def __init__(self, entry):
+        self.url = entry["url"]
+        self.status_code = entry["status"]
+        self.headers = {"Content-Type": entry.get("content_type", "")}
+        self.text = entry["body"]
+        self.encoding = "utf-8"
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def content(self):
+        return self.text.encode("utf-8")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def request_key(method, url, params=None, body=None):
+    """请求指纹：方法 + URL + 去掉易变字段后的参数与 JSON 正文"""
+    params = {k: v for k, v in (params or {}).items() if k not in VOLATILE_KEYS}
+    if isinstance(body, dict):
+        body = {k: v for k, v in body.items() if k not in VOLATILE_KEYS}
+    return json.dumps([method.upper(), url, params, body], sort_keys=True, ensure_ascii=False)
+
+
+class Transport:
+    """录制/回放状态，默认直连上游"""
+
+    def __init__(self):
+        self.mode = LIVE
+        self.path = DEFAULT_ARCHIVE
+        self.timing = "fast"
+        self.entries = {}
+        self.cursors = {}
+        self.lock = threading.Lock()
+
+    def configure(self, mode=LIVE, path=None, timing=None):
+        self.mode = mode
+        self.path = path or DEFAULT_ARCHIVE
+        self.timing = timing or "fast"
+        if mode == REPLAY:
+            try:
+                self.load()
+            except (OSError, ValueError) as e:
+                # 存档缺失或损坏时不影响 handler 启动，退回直连上游
+                print(f"无法读取上游存档 {self.path}（{e}），改为直连上游")
+                self.mode = LIVE
+
+    def load(self):
+        """读取存档，同一请求的多次录制按顺序回放，用完后停留在最后一条"""
+        entries = {}
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries.setdefault(entry["key"], []).append(entry)
+        with self.lock:
+            self.entries = entries
+            self.cursors = {}
+
+    def record(self, method, url, kwargs, response, latency):
+        entry = {
+            "key": request_key(method, url, kwargs.get("params"), kwargs.get("json")),
+            "method": method.upper(),
+            "url": url,
+            "params": kwargs.get("params"),
+            "json": kwargs.get("json"),
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type", ""),
+            "body": response.text,
+            "latency": round(latency, 4),
+            "ts": time.time()
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+
+    def replay(self, method, url, kwargs):
+        key = request_key(method, url, kwargs.get("params"), kwargs.get("json"))
+        with self.lock:
+            recorded = self.entries.get(key)
+            if not recorded:
+                raise ReplayMiss(f"存档中无此请求: {method} {url}")
+            i = self.cursors.get(key, 0)
+            self.cursors[key] = min(i + 1, len(recorded) - 1)
+            entry = recorded[i]
+        if self.timing == "original":
+            time.sleep(entry.get("latency", 0))
+        return ReplayResponse(entry)
+
+
+transport = Transport()
+transport.configure(
+    os.environ.get("FUND_UPSTREAM_MODE", LIVE),
+    os.environ.get("FUND_UPSTREAM_ARCHIVE"),
+    os.environ.get("FUND_REPLAY_TIMING")
+)
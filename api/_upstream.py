@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+上游请求调度器
+按 host 做令牌桶限速与并发上限，交互请求优先于后台任务，超载时快速拒绝
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from urllib.parse import urlparse
+
+import _core
+from _transport import transport, REPLAY, RECORD
+
+# 请求优先级：数值越小越优先
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# host -> (每秒令牌数, 桶容量, 最大并发)
+HOST_LIMITS = {
+    "www.fund123.cn": (8, 16, 6),
+    "push2.eastmoney.com": (5, 10, 4),
+    "fund.eastmoney.com": (3, 6, 2),
+    "gushitong.baidu.com": (5, 10, 4),
+    "finance.pae.baidu.com": (8, 16, 6),
+}
+DEFAULT_LIMIT = (5, 10, 4)
+
+# 各优先级的最长排队时间（秒）与排队上限，超出即拒绝
+MAX_WAIT = {INTERACTIVE: 15.0, BACKGROUND: 30.0}
+MAX_QUEUE = {INTERACTIVE: None, BACKGROUND: 64}
+
+# 批量请求的并行度
+BATCH_WORKERS = 8
+
+_priority = ContextVar("upstream_priority", default=INTERACTIVE)
+_deadline = ContextVar("upstream_deadline", default=None)
+
+
+class UpstreamBusy(Exception):
+    """上游排队超限，请求被拒绝"""
+
+
+class DeadlineExceeded(UpstreamBusy):
+    """请求已超过截止时间，不再发起上游请求"""
+
+
+class HostGate:
+    """单个 host 的令牌桶 + 并发闸门，等待者按 (优先级, 先后) 出队"""
+
+    def __init__(self, rate, burst, concurrency):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.active = 0
+        self.waiting = []
+        self.queued = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.cond = threading.Condition()
+        self._seq = itertools.count()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority, until=None):
+        with self.cond:
+            limit = MAX_QUEUE.get(priority)
+            if limit is not None and self.queued[priority] >= limit:
+                raise UpstreamBusy("上游请求排队已满")
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self.waiting, entry)
+            self.queued[priority] += 1
+            deadline = time.monotonic() + MAX_WAIT[priority]
+            # 截止时间早于最长排队时间时，超时按 DeadlineExceeded 处理
+            by_deadline = until is not None and until < deadline
+            if by_deadline:
+                deadline = until
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    timeout = deadline - now
+                    if self.waiting[0] == entry and self.active < self.concurrency:
+                        if self.tokens >= 1:
+                            self.tokens -= 1
+                            self.active += 1
+                            return
+                        timeout = min(timeout, (1 - self.tokens) / self.rate)
+                    # 队首等待令牌时同样受截止时间与最长排队时间约束
+                    if deadline - now <= 0:
+                        if by_deadline:
+                            raise DeadlineExceeded("排队期间已超过截止时间")
+                        raise UpstreamBusy("上游请求排队超时")
+                    self.cond.wait(max(timeout, 0.001))
+            finally:
+                self.waiting.remove(entry)
+                heapq.heapify(self.waiting)
+                self.queued[priority] -= 1
+                self.cond.notify_all()
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def penalize(self):
+        """上游返回 429 时清空令牌，暂停约一秒；多次 429 不叠加"""
+        with self.cond:
+            self.tokens = min(self.tokens, -self.rate)
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def get_gate(host):
+    gate = _gates.get(host)
+    if gate is None:
+        with _gates_lock:
+            gate = _gates.get(host)
+            if gate is None:
+                gate = _gates[host] = HostGate(*HOST_LIMITS.get(host, DEFAULT_LIMIT))
+    return gate
+
+
+@contextmanager
+def priority(level):
+    """在上下文中设置上游请求优先级"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextmanager
+def deadline(seconds):
+    """在上下文中设置截止时间：排队等待与请求超时都不会超过剩余时间"""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def request(client, method, url, **kwargs):
+    """经调度器发出请求，client 为 requests.Session，None 时直接使用 requests；录制/回放见 _transport"""
+    if transport.mode == REPLAY:
+        return transport.replay(method, url, kwargs)
+    if client is None:
+        client = _core.load_requests()
+    until = _deadline.get()
+    if until is not None:
+        remaining = until - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("请求已超过截止时间")
+        kwargs["timeout"] = min(kwargs.get("timeout") or remaining, remaining)
+    gate = get_gate(urlparse(url).hostname)
+    gate.acquire(_priority.get(), until)
+    try:
+        started = time.monotonic()
+        response = client.request(method, url, **kwargs)
+        latency = time.monotonic() - started
+    finally:
+        gate.release()
+    if response.status_code == 429:
+        gate.penalize()
+    if transport.mode == RECORD:
+        transport.record(method, url, kwargs, response, latency)
+    return response
+
+
+def get(client, url, **kwargs):
+    return request(client, "GET", url, **kwargs)
+
+
+def post(client, url, **kwargs):
+    return request(client, "POST", url, **kwargs)
+
+
+def run_parallel(fn, args_list, workers=BATCH_WORKERS):
+    """并行执行批量任务，保持输入顺序并继承当前优先级"""
+    if len(args_list) <= 1:
+        return [fn(*args) for args in args_list]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(workers, len(args_list))) as pool:
+        futures = [pool.submit(copy_context().run, fn, *args) for args in args_list]
+        return [f.result() for f in futures]
@@ -3,16 +3,23 @@
 基金数据代理 API - Vercel Serverless Function
 """
 
-from http.server import BaseHTTPRequestHandler
-import json
+import bisect
+import os
 import re
+import sys
+import threading
 import time
+import uuid
+from array import array
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from urllib.parse import parse_qs, urlparse
 
-import requests
-import urllib3
-urllib3.disable_warnings()
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _core
+import _upstream as upstream
+from _alerts import alert_engine
+from _router import ApiHandler, Param, fund_pairs, router
+from _upstream import UpstreamBusy
 
 # HTTP 请求头
 FUND_HEADERS = {
@@ -21,22 +28,28 @@ FUND_HEADERS = {
     "Content-Type": "application/json",
     "Origin": "https://www.fund123.cn",
     "Referer": "https://www.fund123.cn/fund",
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    "User-Agent": _core.USER_AGENT
 }
 
+CSRF_RE = re.compile(r'"csrf":"([^"]+)"')
+GROWTH_RE = re.compile(r'"dayOfGrowth":"([^"]+)"')
+NET_VALUE_DATE_RE = re.compile(r'"netValueDate":"([^"]+)"')
+
 
 def get_csrf_token(session):
     """获取 CSRF Token"""
     try:
-        response = session.get(
-            "https://www.fund123.cn/fund",
+        response = upstream.get(
+            session, "https://www.fund123.cn/fund",
             headers=FUND_HEADERS,
             timeout=15,
             verify=False
         )
-        token_match = re.findall(r'"csrf":"([^"]+)"', response.text)
+        token_match = CSRF_RE.findall(response.text)
         if token_match:
             return token_match[0]
+    except UpstreamBusy:
+        raise
     except Exception as e:
         print(f"获取 CSRF 失败: {e}")
     return ""
@@ -44,12 +57,12 @@ def get_csrf_token(session):
 
 def search_fund(code):
     """搜索基金"""
-    session = requests.Session()
+    session = _core.new_session()
     csrf = get_csrf_token(session)
     
     try:
-        response = session.post(
-            "https://www.fund123.cn/api/fund/searchFund",
+        response = upstream.post(
+            session, "https://www.fund123.cn/api/fund/searchFund",
             headers=FUND_HEADERS,
             params={"_csrf": csrf},
             json={"fundCode": code},
@@ -63,6 +76,8 @@ def search_fund(code):
                 "fund_key": data["fundInfo"]["key"],
                 "fund_name": data["fundInfo"]["fundName"]
             }
+    except UpstreamBusy:
+        raise
     except Exception as e:
         print(f"搜索基金失败: {e}")
     
@@ -73,10 +88,10 @@ def fetch_fund_detail(session, code):
     """获取基金日涨幅"""
     try:
         url = f"https://www.fund123.cn/matiaria?fundCode={code}"
-        response = session.get(url, headers=FUND_HEADERS, timeout=15, verify=False)
+        response = upstream.get(session, url, headers=FUND_HEADERS, timeout=15, verify=False)
         
-        growth_match = re.findall(r'"dayOfGrowth":"([^"]+)"', response.text)
-        date_match = re.findall(r'"netValueDate":"([^"]+)"', response.text)
+        growth_match = GROWTH_RE.findall(response.text)
+        date_match = NET_VALUE_DATE_RE.findall(response.text)
         
         if growth_match:
             growth_val = round(float(growth_match[0]), 2)
@@ -84,6 +99,8 @@ def fetch_fund_detail(session, code):
             if date_match:
                 daily_change = f"{growth_val}%({date_match[0]})"
             return {"daily_change": daily_change}
+    except UpstreamBusy:
+        raise
     except Exception as e:
         print(f"获取基金详情失败: {e}")
     
@@ -93,8 +110,8 @@ def fetch_fund_detail(session, code):
 def fetch_fund_trend(session, csrf, fund_key):
     """获取基金 30 天趋势"""
     try:
-        response = session.post(
-            "https://www.fund123.cn/api/fund/queryFundQuotationCurves",
+        response = upstream.post(
+            session, "https://www.fund123.cn/api/fund/queryFundQuotationCurves",
             headers=FUND_HEADERS,
             params={"_csrf": csrf},
             json={"productId": fund_key, "dateInterval": "ONE_MONTH"},
@@ -151,136 +168,394 @@ def fetch_fund_trend(session, csrf, fund_key):
             "streak_change": f"{streak_change}%"
         }
         
+    except UpstreamBusy:
+        raise
+    
     except Exception as e:
         print(f"获取趋势失败: {e}")
     
     return {}
 
 
+def query_estimate_intraday(session, csrf, fund_key):
+    """请求当日分时估值原始数据，返回 (交易日, 按时间升序的估值点列表)"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    
+    response = upstream.post(
+        session, "https://www.fund123.cn/api/fund/queryFundEstimateIntraday",
+        headers=FUND_HEADERS,
+        params={"_csrf": csrf},
+        json={
+            "startTime": today,
+            "endTime": tomorrow,
+            "limit": 200,
+            "productId": fund_key,
+            "format": True,
+            "source": "WEALTHBFFWEB"
+        },
+        timeout=15,
+        verify=False
+    )
+    
+    data = response.json()
+    if data.get("success") and data.get("list"):
+        return today, data["list"]
+    return today, []
+
+
 def fetch_fund_estimate(session, csrf, fund_key):
     """获取基金实时估值"""
     try:
-        today = datetime.now().strftime("%Y-%m-%d")
-        tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
-        
-        response = session.post(
-            "https://www.fund123.cn/api/fund/queryFundEstimateIntraday",
-            headers=FUND_HEADERS,
-            params={"_csrf": csrf},
-            json={
-                "startTime": today,
-                "endTime": tomorrow,
-                "limit": 200,
-                "productId": fund_key,
-                "format": True,
-                "source": "WEALTHBFFWEB"
-            },
-            timeout=15,
-            verify=False
-        )
-        
-        data = response.json()
-        if data.get("success") and data.get("list"):
-            latest = data["list"][-1]
+        today, points = query_estimate_intraday(session, csrf, fund_key)
+        if points:
+            estimate_curves.update(fund_key, today, points)
+            latest = points[-1]
             estimate_time = datetime.fromtimestamp(latest["time"] / 1000).strftime("%H:%M:%S")
             estimate_val = round(float(latest["forecastGrowth"]) * 100, 2)
             return {
                 "estimate_time": estimate_time,
                 "estimate_change": f"{estimate_val}%"
             }
+    except UpstreamBusy:
+        raise
     except Exception as e:
         print(f"获取估值失败: {e}")
     
     return {"estimate_time": "N/A", "estimate_change": "N/A"}
 
 
-def fetch_fund_valuation(code, fund_key):
-    """获取基金完整估值数据"""
-    session = requests.Session()
-    csrf = get_csrf_token(session)
+# 分时估值曲线缓存：按基金与交易日保存已解析的点，轮询时只追加新点
+ESTIMATE_CURVE_FUNDS = 512      # 最多缓存的基金数
+
+
+class EstimateCurveCache:
+    """基金当日估值曲线，time（毫秒）与 estimate（%）两列 array('d')"""
+
+    def __init__(self, max_funds=ESTIMATE_CURVE_FUNDS):
+        self.max_funds = max_funds
+        self.curves = OrderedDict()
+        self.lock = threading.Lock()
+
+    def update(self, fund_key, day, points):
+        """合并上游返回的点，只解析比已缓存最后一点更新的部分"""
+        with self.lock:
+            entry = self.curves.get(fund_key)
+            if entry is None or entry[0] != day:
+                entry = self.curves[fund_key] = (day, array('d'), array('d'))
+            self.curves.move_to_end(fund_key)
+            while len(self.curves) > self.max_funds:
+                self.curves.popitem(last=False)
+            
+            _, times, values = entry
+            last = times[-1] if times else -1
+            start = len(points)
+            while start > 0 and points[start - 1]["time"] > last:
+                start -= 1
+            for p in points[start:]:
+                times.append(p["time"])
+                values.append(float(p["forecastGrowth"]) * 100)
+
+    def get(self, fund_key, day, since=0):
+        """返回 since（毫秒）之后的 (times, values) 副本"""
+        with self.lock:
+            entry = self.curves.get(fund_key)
+            if entry is None or entry[0] != day:
+                return [], []
+            _, times, values = entry
+            start = bisect.bisect_right(times, since)
+            return list(times[start:]), list(values[start:])
+
+
+estimate_curves = EstimateCurveCache()
+
+
+def lttb(times, values, threshold):
+    """Largest-Triangle-Three-Buckets 降采样，保留首尾点与形状特征"""
+    n = len(times)
+    if threshold <= 0 or n <= threshold:
+        return times, values
+    if threshold < 3:
+        return [times[0], times[-1]][:threshold], [values[0], values[-1]][:threshold]
+    
+    out_t, out_v = [times[0]], [values[0]]
+    bucket = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket) + 1
+        end = int((i + 1) * bucket) + 1
+        next_end = min(int((i + 2) * bucket) + 1, n)
+        # 下一个桶的平均点
+        if end < next_end:
+            avg_t = sum(times[end:next_end]) / (next_end - end)
+            avg_v = sum(values[end:next_end]) / (next_end - end)
+        else:
+            avg_t, avg_v = times[-1], values[-1]
+        
+        ta, va = times[a], values[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ta - avg_t) * (values[j] - va) - (ta - times[j]) * (avg_v - va))
+            if area > best_area:
+                best, best_area = j, area
+        out_t.append(times[best])
+        out_v.append(values[best])
+        a = best
+    
+    out_t.append(times[-1])
+    out_v.append(values[-1])
+    return out_t, out_v
+
+
+def fetch_fund_estimate_curve(code, fund_key, since=0, points=0, session=None, csrf=None):
+    """获取基金当日分时估值曲线，since 为毫秒时间戳，points 为降采样后的点数
     
-    result = {
+    批量请求时传入共用的 session 与 csrf，每只基金不再单独获取 CSRF
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    try:
+        if session is None:
+            session = _core.new_session()
+            csrf = get_csrf_token(session)
+        today, raw = query_estimate_intraday(session, csrf, fund_key)
+        if raw:
+            estimate_curves.update(fund_key, today, raw)
+    except UpstreamBusy:
+        raise
+    except Exception as e:
+        print(f"获取估值曲线失败: {e}")
+    
+    times, values = estimate_curves.get(fund_key, today, since)
+    times, values = lttb(times, values, points)
+    return {
         "code": code,
         "fund_key": fund_key,
-        "daily_change": "N/A",
-        "estimate_time": "N/A",
-        "estimate_change": "N/A",
-        "streak_days": 0,
-        "streak_change": "0%",
-        "monthly_up_days": 0,
-        "monthly_total_days": 0,
-        "monthly_change": "0%"
+        "date": today,
+        "time": [int(t) for t in times],
+        "estimate": [round(v, 3) for v in values]
     }
+
+
+def fetch_batch_estimate_curve(funds, points=48):
+    """批量获取自选基金的估值迷你走势图"""
+    with upstream.priority(upstream.BACKGROUND):
+        # 整批共用一个 session 与 CSRF，每只基金只需一次上游请求
+        session = _core.new_session()
+        csrf = get_csrf_token(session) if funds else ""
+        return upstream.run_parallel(fetch_fund_estimate_curve,
+                                     [(code, fund_key, 0, points, session, csrf) for code, fund_key in funds])
+
+
+# fields 参数的字段分组：daily 来自详情页，trend 与 estimate 需要 CSRF
+VALUATION_FIELDS = {
+    "daily": ("daily_change",),
+    "estimate": ("estimate_time", "estimate_change"),
+    "trend": ("streak_days", "streak_change", "monthly_up_days", "monthly_total_days", "monthly_change"),
+}
+
+
+def parse_valuation_fields(fields_str):
+    """解析 fields 参数（逗号分隔），为空时返回 None 表示全部字段"""
+    fields = [f for f in fields_str.split(',') if f]
+    unknown = [f for f in fields if f not in VALUATION_FIELDS]
+    if unknown:
+        raise ValueError(f"未知字段: {','.join(unknown)}，可选 {','.join(VALUATION_FIELDS)}")
+    return tuple(fields) or None
+
+
+VALUATION_DEFAULTS = {
+    "daily_change": "N/A",
+    "estimate_time": "N/A",
+    "estimate_change": "N/A",
+    "streak_days": 0,
+    "streak_change": "0%",
+    "monthly_up_days": 0,
+    "monthly_total_days": 0,
+    "monthly_change": "0%"
+}
+
+
+def valuation_defaults(code, fund_key, fields=None):
+    """fields 对应字段的默认值，上游失败或被限流时返回"""
+    wanted = {k for group in (fields or VALUATION_FIELDS) for k in VALUATION_FIELDS[group]}
+    result = {"code": code, "fund_key": fund_key}
+    result.update((k, v) for k, v in VALUATION_DEFAULTS.items() if k in wanted)
+    return result
+
+
+def needs_csrf(fields):
+    return bool(set(fields or VALUATION_FIELDS) & {"trend", "estimate"})
+
+
+def fetch_fund_valuation(code, fund_key, fields=None, session=None, csrf=None):
+    """获取基金估值数据，fields 为 VALUATION_FIELDS 中的分组，只发起所需的上游请求
+    
+    批量请求时传入共用的 session 与 csrf，每只基金不再单独获取 CSRF
+    """
+    fields = set(fields or VALUATION_FIELDS)
+    if session is None:
+        session = _core.new_session()
+        csrf = get_csrf_token(session) if needs_csrf(fields) else ""
+    result = valuation_defaults(code, fund_key, fields)
     
-    detail = fetch_fund_detail(session, code)
-    result.update(detail)
+    if "daily" in fields:
+        detail = fetch_fund_detail(session, code)
+        result.update(detail)
     
-    trend = fetch_fund_trend(session, csrf, fund_key)
-    result.update(trend)
+    if "trend" in fields:
+        trend = fetch_fund_trend(session, csrf, fund_key)
+        result.update(trend)
     
-    estimate = fetch_fund_estimate(session, csrf, fund_key)
-    result.update(estimate)
+    if "estimate" in fields:
+        estimate = fetch_fund_estimate(session, csrf, fund_key)
+        result.update(estimate)
     
+    alert_engine.observe(result)
     return result
 
 
-class handler(BaseHTTPRequestHandler):
-    def _send_json(self, data):
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json; charset=utf-8')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+def fetch_batch_valuation(funds, fields=None):
+    """批量获取基金估值，funds 为 (code, fund_key) 列表，按后台优先级并行请求
     
-    def do_OPTIONS(self):
-        self._send_json({})
+    单只基金被限流时返回默认值并标记 busy，只有全部基金都被拒绝时才抛出 UpstreamBusy
+    """
+    errors = []
     
-    def do_GET(self):
-        parsed = urlparse(self.path)
-        params = parse_qs(parsed.query)
-        action = params.get('action', [''])[0]
-        
-        result = {"success": False, "message": "未知操作"}
-        
+    def fetch_one(code, fund_key):
         try:
-            if action == 'search':
-                code = params.get('code', [''])[0]
-                if code and len(code) == 6:
-                    result = search_fund(code)
-                else:
-                    result = {"success": False, "message": "请输入6位基金代码"}
-            
-            elif action == 'valuation':
-                code = params.get('code', [''])[0]
-                fund_key = params.get('fund_key', [''])[0]
-                if code and fund_key:
-                    result = {"success": True, "data": fetch_fund_valuation(code, fund_key)}
-                else:
-                    result = {"success": False, "message": "缺少参数"}
-            
-            elif action == 'batch_valuation':
-                funds_str = params.get('funds', [''])[0]
-                if funds_str:
-                    valuations = []
-                    for item in funds_str.split(','):
-                        parts = item.split(':')
-                        if len(parts) == 2:
-                            code, fund_key = parts
-                            val = fetch_fund_valuation(code, fund_key)
-                            valuations.append(val)
-                    result = {"success": True, "data": valuations}
-                else:
-                    result = {"success": False, "message": "缺少基金列表"}
-            
-            else:
-                result = {"success": False, "message": f"未知操作: {action}"}
-        
-        except Exception as e:
-            result = {"success": False, "message": str(e)}
-        
-        self._send_json(result)
+            return fetch_fund_valuation(code, fund_key, fields, session, csrf)
+        except UpstreamBusy as e:
+            errors.append(e)
+            result = valuation_defaults(code, fund_key, fields)
+            result["busy"] = True
+            return result
+    
+    with upstream.priority(upstream.BACKGROUND):
+        # 整批共用一个 session 与 CSRF，仅估值时每只基金只需一次上游请求
+        session = _core.new_session()
+        csrf = get_csrf_token(session) if funds and needs_csrf(fields) else ""
+        valuations = upstream.run_parallel(fetch_one, funds)
+    if valuations and len(errors) == len(valuations):
+        raise errors[0]
+    return valuations
+
+
+# 增量轮询：只有这些字段变化的基金才会出现在增量响应中
+DELTA_FIELDS = ("estimate_change", "estimate_time", "daily_change")
+DELTA_HISTORY = 256             # 保留最近多少个版本的快照
+
+
+class ValuationSnapshots:
+    """最近若干次 batch_valuation 响应的基金快照，按版本号索引"""
+
+    def __init__(self, size=DELTA_HISTORY):
+        self.size = size
+        self.history = OrderedDict()
+        self.lock = threading.Lock()
+        # 实例前缀避免不同 Serverless 实例的版本号相互混淆
+        self.prefix = uuid.uuid4().hex[:8]
+        self.seq = 0
+
+    def save(self, valuations, previous=None):
+        """保存快照并返回版本号；被限流（busy）的基金沿用上一版本的值"""
+        previous = previous or {}
+        snapshot = {}
+        for v in valuations:
+            if not v.get("busy"):
+                snapshot[v["code"]] = {f: v[f] for f in DELTA_FIELDS if f in v}
+            elif v["code"] in previous:
+                snapshot[v["code"]] = previous[v["code"]]
+        with self.lock:
+            self.seq += 1
+            token = f"{self.prefix}-{self.seq}"
+            self.history[token] = snapshot
+            while len(self.history) > self.size:
+                self.history.popitem(last=False)
+        return token
+
+    def get(self, token):
+        with self.lock:
+            return self.history.get(token)
+
+
+valuation_snapshots = ValuationSnapshots()
+
+
+def fetch_batch_valuation_delta(funds, since="", fields=None):
+    """批量估值，since 为上次响应的 version，有效时只返回变化的基金"""
+    valuations = fetch_batch_valuation(funds, fields)
+    previous = valuation_snapshots.get(since) if since else None
+    version = valuation_snapshots.save(valuations, previous)
+    
+    if previous is None:
+        return {"success": True, "data": valuations, "version": version, "delta": False}
     
-    def do_POST(self):
-        self.do_GET()
+    # 只比较本次请求包含的字段，fields 不同的两次轮询之间也能正确求差；
+    # busy 的基金客户端保留上次的值，不下发默认值
+    changed = [v for v in valuations
+               if v["code"] not in previous
+               or (not v.get("busy")
+                   and any(previous[v["code"]].get(f) != v[f] for f in DELTA_FIELDS if f in v))]
+    return {"success": True, "data": changed, "version": version, "delta": True}
+
+
+# ---- 路由 ----
+
+FUND_CODE = Param("code", required=True)
+FUND_KEY = Param("fund_key", required=True)
+FUND_LIST = Param("funds", fund_pairs, required=True, message="缺少基金列表")
+FIELDS = Param("fields", parse_valuation_fields, default=None)
+
+
+@router.action("fund", "search", Param("code", required=True, pattern=r"^.{6}$",
+                                       message="请输入6位基金代码", invalid="请输入6位基金代码"))
+def _search(code):
+    return search_fund(code)
+
+
+@router.action("fund", "valuation", FUND_CODE, FUND_KEY, FIELDS)
+def _valuation(code, fund_key, fields):
+    return {"success": True, "data": fetch_fund_valuation(code, fund_key, fields)}
+
+
+@router.action("fund", "batch_valuation", FUND_LIST, Param("since"), FIELDS)
+def _batch_valuation(funds, since, fields):
+    return fetch_batch_valuation_delta(funds, since, fields)
+
+
+@router.action("fund", "curve", FUND_CODE, FUND_KEY, Param("since", int, 0), Param("points", int, 0))
+def _curve(code, fund_key, since, points):
+    return {"success": True, "data": fetch_fund_estimate_curve(code, fund_key, since, points)}
+
+
+@router.action("fund", "batch_curve", FUND_LIST, Param("points", int, 48))
+def _batch_curve(funds, points):
+    return {"success": True, "data": fetch_batch_estimate_curve(funds, points)}
+
+
+# 阈值提醒（仅本地服务器）
+@router.action("fund", "add_alert", FUND_CODE, Param("metric", default="estimate_change"), Param("op", default="lt"),
+               Param("threshold", float, required=True), Param("fund_key"), Param("note"), long_running=True)
+def _add_alert(code, metric, op, threshold, fund_key, note):
+    return {"success": True, "data": alert_engine.add_rule(code, metric, op, threshold, fund_key, note)}
+
+
+@router.action("fund", "remove_alert", Param("id", int, required=True), long_running=True)
+def _remove_alert(id):
+    if alert_engine.remove_rule(id):
+        return {"success": True}
+    return {"success": False, "message": "提醒规则不存在"}
+
+
+@router.action("fund", "alert_rules", Param("code", default=None), long_running=True)
+def _alert_rules(code):
+    return {"success": True, "data": alert_engine.list_rules(code)}
+
+
+@router.action("fund", "alerts", Param("since", int, 0), Param("wait", float, 0), long_running=True)
+def _alerts(since, wait):
+    return {"success": True, "data": alert_engine.poll(since, wait)}
+
+
+class handler(ApiHandler):
+    endpoint = "fund"
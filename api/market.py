@@ -3,21 +3,22 @@
 市场数据代理 API - Vercel Serverless Function
 """
 
-from http.server import BaseHTTPRequestHandler
-import json
+import os
+import sys
 from datetime import datetime, timedelta
-from urllib.parse import parse_qs, urlparse
 
-import requests
-import urllib3
-urllib3.disable_warnings()
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _core
+import _upstream as upstream
+from _router import ApiHandler, Param, router
+from _upstream import UpstreamBusy
 
 MARKET_HEADERS = {
     "Accept": "application/vnd.finance-web.v1+json",
     "Accept-Language": "zh-CN,zh;q=0.9",
     "Origin": "https://gushitong.baidu.com",
     "Referer": "https://gushitong.baidu.com/",
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    "User-Agent": _core.USER_AGENT
 }
 
 
@@ -26,13 +27,12 @@ def fetch_global_indices():
     indices = []
     
     try:
-        session = requests.Session()
-        session.headers.update(MARKET_HEADERS)
-        session.get("https://gushitong.baidu.com/index/ab-000001", timeout=10, verify=False)
+        session = _core.new_session(MARKET_HEADERS)
+        upstream.get(session, "https://gushitong.baidu.com/index/ab-000001", timeout=10, verify=False)
         
         for market in ["asia", "america"]:
             url = f"https://finance.pae.baidu.com/api/getbanner?market={market}&finClientType=pc"
-            response = session.get(url, timeout=15, verify=False)
+            response = upstream.get(session, url, timeout=15, verify=False)
             data = response.json()
             
             if data.get("ResultCode") == "0":
@@ -43,8 +43,8 @@ def fetch_global_indices():
                         "change_percent": item["ratio"]
                     })
         
-        response = session.get(
-            "https://finance.pae.baidu.com/vapi/v1/getquotation",
+        response = upstream.get(
+            session, "https://finance.pae.baidu.com/vapi/v1/getquotation",
             params={
                 "srcid": "5353", "all": "1", "pointType": "string",
                 "group": "quotation_index_minute", "query": "399006",
@@ -63,6 +63,8 @@ def fetch_global_indices():
             else:
                 indices.append(chinext)
     
+    except UpstreamBusy:
+        raise
     except Exception as e:
         print(f"获取指数失败: {e}")
     
@@ -74,12 +76,11 @@ def fetch_intraday_index(count=20):
     points = []
     
     try:
-        session = requests.Session()
-        session.headers.update(MARKET_HEADERS)
-        session.get("https://gushitong.baidu.com/index/ab-000001", timeout=10, verify=False)
+        session = _core.new_session(MARKET_HEADERS)
+        upstream.get(session, "https://gushitong.baidu.com/index/ab-000001", timeout=10, verify=False)
         
-        response = session.get(
-            "https://finance.pae.baidu.com/vapi/v1/getquotation",
+        response = upstream.get(
+            session, "https://finance.pae.baidu.com/vapi/v1/getquotation",
             params={
                 "srcid": "5353", "all": "1", "pointType": "string",
                 "group": "quotation_index_minute", "query": "000001",
@@ -108,6 +109,8 @@ def fetch_intraday_index(count=20):
                         "turnover": f"{turnover}亿"
                     })
     
+    except UpstreamBusy:
+        raise
     except Exception as e:
         print(f"获取分时数据失败: {e}")
     
@@ -119,12 +122,11 @@ def fetch_volume_trend(days=7):
     volumes = []
     
     try:
-        session = requests.Session()
-        session.headers.update(MARKET_HEADERS)
-        session.get("https://gushitong.baidu.com/index/ab-000001", timeout=10, verify=False)
+        session = _core.new_session(MARKET_HEADERS)
+        upstream.get(session, "https://gushitong.baidu.com/index/ab-000001", timeout=10, verify=False)
         
-        response = session.get(
-            "https://finance.pae.baidu.com/sapi/v1/metrictrend",
+        response = upstream.get(
+            session, "https://finance.pae.baidu.com/sapi/v1/metrictrend",
             params={
                 "financeType": "index", "market": "ab", "code": "000001",
                 "targetType": "market", "metric": "amount", "finClientType": "pc"
@@ -153,47 +155,30 @@ def fetch_volume_trend(days=7):
                         "beijing_volume": f"{bj_data['data']['amount']}亿"
                     })
     
+    except UpstreamBusy:
+        raise
     except Exception as e:
         print(f"获取成交量失败: {e}")
     
     return volumes
 
 
-class handler(BaseHTTPRequestHandler):
-    def _send_json(self, data):
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json; charset=utf-8')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
-    
-    def do_OPTIONS(self):
-        self._send_json({})
-    
-    def do_GET(self):
-        parsed = urlparse(self.path)
-        params = parse_qs(parsed.query)
-        action = params.get('action', [''])[0]
-        
-        result = {"success": False, "message": "未知操作"}
-        
-        try:
-            if action == 'indices':
-                result = {"success": True, "data": fetch_global_indices()}
-            elif action == 'intraday':
-                count = int(params.get('count', ['20'])[0])
-                result = {"success": True, "data": fetch_intraday_index(count)}
-            elif action == 'volume':
-                days = int(params.get('days', ['7'])[0])
-                result = {"success": True, "data": fetch_volume_trend(days)}
-            else:
-                result = {"success": False, "message": f"未知操作: {action}"}
-        except Exception as e:
-            result = {"success": False, "message": str(e)}
-        
-        self._send_json(result)
-    
-    def do_POST(self):
-        self.do_GET()
+# ---- 路由（max_age 与 public/sw.js 中的 API_MAX_AGE 保持一致）----
+
+@router.action("market", "indices", max_age=30)
+def _indices():
+    return {"success": True, "data": fetch_global_indices()}
+
+
+@router.action("market", "intraday", Param("count", int, 20), max_age=30)
+def _intraday(count):
+    return {"success": True, "data": fetch_intraday_index(count)}
+
+
+@router.action("market", "volume", Param("days", int, 7), max_age=600)
+def _volume(days):
+    return {"success": True, "data": fetch_volume_trend(days)}
+
+
+class handler(ApiHandler):
+    endpoint = "market"
@@ -3,19 +3,25 @@
 板块数据代理 API - Vercel Serverless Function
 """
 
-from http.server import BaseHTTPRequestHandler
 import json
+import os
 import random
-from urllib.parse import parse_qs, urlparse
+import sys
+import threading
+import time
+from array import array
 
-import requests
-import urllib3
-urllib3.disable_warnings()
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _codec
+import _core
+import _upstream as upstream
+from _router import ApiHandler, Param, router
+from _upstream import UpstreamBusy
 
 DEFAULT_HEADERS = {
     "Accept": "application/json, text/plain, */*",
     "Accept-Language": "zh-CN,zh;q=0.9",
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    "User-Agent": _core.USER_AGENT
 }
 
 SECTOR_CATEGORIES = {
@@ -66,41 +72,52 @@ SECTOR_CATEGORIES = {
 }
 
 
+def fetch_sector_flow_raw():
+    """获取行业板块资金流向原始数据（东方财富 clist 接口）"""
+    response = upstream.get(
+        None, "https://push2.eastmoney.com/api/qt/clist/get",
+        headers=DEFAULT_HEADERS,
+        params={
+            "cb": "", "fid": "f62", "po": "1", "pz": "100", "pn": "1",
+            "np": "1", "fltt": "2", "invt": "2",
+            "ut": "8dec03ba335b81bf4ebdf7b29ec27d15",
+            "fs": "m:90 t:2",
+            "fields": "f12,f14,f2,f3,f62,f184,f66,f69,f72,f75,f78,f81,f84,f87,f204,f205,f124,f1,f13"
+        },
+        timeout=15, verify=False
+    )
+    
+    data = response.json()
+    if data.get("data"):
+        return data["data"]["diff"]
+    return []
+
+
 def fetch_sector_performance():
     """获取行业板块资金流向"""
     sectors = []
     
     try:
-        response = requests.get(
-            "https://push2.eastmoney.com/api/qt/clist/get",
-            headers=DEFAULT_HEADERS,
-            params={
-                "cb": "", "fid": "f62", "po": "1", "pz": "100", "pn": "1",
-                "np": "1", "fltt": "2", "invt": "2",
-                "ut": "8dec03ba335b81bf4ebdf7b29ec27d15",
-                "fs": "m:90 t:2",
-                "fields": "f12,f14,f2,f3,f62,f184,f66,f69,f72,f75,f78,f81,f84,f87,f204,f205,f124,f1,f13"
-            },
-            timeout=15, verify=False
-        )
+        with upstream.priority(upstream.BACKGROUND):
+            items = fetch_sector_flow_raw()
         
-        data = response.json()
-        if data.get("data"):
-            for item in data["data"]["diff"]:
-                main_flow = round(item["f62"] / 100000000, 2)
-                retail_flow = round(item["f84"] / 100000000, 2)
-                
-                sectors.append({
-                    "name": item["f14"],
-                    "change_percent": f"{item['f3']}%",
-                    "main_flow": f"{main_flow}亿",
-                    "main_flow_ratio": f"{round(item['f184'], 2)}%",
-                    "retail_flow": f"{retail_flow}亿",
-                    "retail_flow_ratio": f"{round(item['f87'], 2)}%"
-                })
+        for item in items:
+            main_flow = round(item["f62"] / 100000000, 2)
+            retail_flow = round(item["f84"] / 100000000, 2)
             
-            sectors.sort(key=lambda x: float(x["change_percent"].replace("%", "")), reverse=True)
+            sectors.append({
+                "name": item["f14"],
+                "change_percent": f"{item['f3']}%",
+                "main_flow": f"{main_flow}亿",
+                "main_flow_ratio": f"{round(item['f184'], 2)}%",
+                "retail_flow": f"{retail_flow}亿",
+                "retail_flow_ratio": f"{round(item['f87'], 2)}%"
+            })
+        
+        sectors.sort(key=lambda x: float(x["change_percent"].replace("%", "")), reverse=True)
     
+    except UpstreamBusy:
+        raise
     except Exception as e:
         print(f"获取板块行情失败: {e}")
     
@@ -112,16 +129,17 @@ def fetch_sector_funds(sector_code):
     funds = []
     
     try:
-        response = requests.get(
-            "https://fund.eastmoney.com/data/FundGuideapi.aspx",
-            headers=DEFAULT_HEADERS,
-            params={
-                "dt": "4", "sd": "", "ed": "", "tp": sector_code,
-                "sc": "1n", "st": "desc", "pi": "1", "pn": "500",
-                "zf": "diy", "sh": "list", "rnd": str(random.random())
-            },
-            timeout=30, verify=False
-        )
+        with upstream.priority(upstream.BACKGROUND):
+            response = upstream.get(
+                None, "https://fund.eastmoney.com/data/FundGuideapi.aspx",
+                headers=DEFAULT_HEADERS,
+                params={
+                    "dt": "4", "sd": "", "ed": "", "tp": sector_code,
+                    "sc": "1n", "st": "desc", "pi": "1", "pn": "500",
+                    "zf": "diy", "sh": "list", "rnd": str(random.random())
+                },
+                timeout=30, verify=False
+            )
         
         text = response.text.replace("var rankData =", "").strip()
         data = json.loads(text)
@@ -145,6 +163,8 @@ def fetch_sector_funds(sector_code):
                 "since_inception": f"{parts[24] or '---'}%"
             })
     
+    except UpstreamBusy:
+        raise
     except Exception as e:
         print(f"获取板块基金失败: {e}")
     
@@ -160,43 +180,166 @@ def get_sector_list():
     return result
 
 
-class handler(BaseHTTPRequestHandler):
-    def _send_json(self, data):
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json; charset=utf-8')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
-    
-    def do_OPTIONS(self):
-        self._send_json({})
-    
-    def do_GET(self):
-        parsed = urlparse(self.path)
-        params = parse_qs(parsed.query)
-        action = params.get('action', [''])[0]
-        
-        result = {"success": False, "message": "未知操作"}
-        
+# 板块列表为常量，导入时预编码整份响应
+SECTOR_LIST_RESPONSE = _codec.preencode({"success": True, "data": get_sector_list()})
+
+
+# 资金流采样：每个板块一个定长环形缓冲区，内存占用与运行天数无关
+FLOW_SAMPLE_INTERVAL = 30       # 采样间隔（秒）
+FLOW_BUFFER_SIZE = 1024         # 每个板块保留的采样点数（约两个交易日）
+FLOW_MAX_SECTORS = 200          # 最多跟踪的板块数
+
+
+class SectorFlowBuffer:
+    """单个板块的资金流环形缓冲区，按列存储为 array('d')"""
+
+    COLUMNS = ("time", "main_flow", "retail_flow", "change")
+
+    def __init__(self, name, capacity=FLOW_BUFFER_SIZE):
+        self.name = name
+        self.capacity = capacity
+        self.columns = {c: array('d', bytes(8 * capacity)) for c in self.COLUMNS}
+        self.head = 0
+        self.size = 0
+
+    def append(self, ts, main_flow, retail_flow, change):
+        i = self.head
+        self.columns["time"][i] = ts
+        self.columns["main_flow"][i] = main_flow
+        self.columns["retail_flow"][i] = retail_flow
+        self.columns["change"][i] = change
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def last_time(self):
+        if not self.size:
+            return None
+        return self.columns["time"][(self.head - 1) % self.capacity]
+
+    def indices(self):
+        """按时间先后返回有效数据的下标"""
+        start = (self.head - self.size) % self.capacity
+        return [(start + k) % self.capacity for k in range(self.size)]
+
+
+def downsample_indices(indices, points):
+    """等距降采样，每个桶取最后一个点（资金流为累计值，取桶末即可）"""
+    n = len(indices)
+    if not points or points <= 0 or n <= points:
+        return indices
+    step = n / points
+    return [indices[min(n - 1, int((k + 1) * step) - 1)] for k in range(points)]
+
+
+class SectorFlowRecorder:
+    """板块资金流时间序列记录器，供长时间运行的服务器定时采样"""
+
+    def __init__(self, capacity=FLOW_BUFFER_SIZE, max_sectors=FLOW_MAX_SECTORS):
+        self.capacity = capacity
+        self.max_sectors = max_sectors
+        self.buffers = {}
+        self.names = {}
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def record(self, items, now=None):
+        """写入一次 clist 快照，f124 未变化的板块（休市）跳过"""
+        now = now or time.time()
+        with self.lock:
+            for item in items:
+                code = item.get("f12")
+                if not code or not isinstance(item.get("f62"), (int, float)):
+                    continue
+                ts = float(item.get("f124") or now)
+                buf = self.buffers.get(code)
+                if buf is None:
+                    if len(self.buffers) >= self.max_sectors:
+                        stale = min(self.buffers, key=lambda c: self.buffers[c].last_time() or 0)
+                        evicted = self.buffers.pop(stale)
+                        if self.names.get(evicted.name) == stale:
+                            del self.names[evicted.name]
+                    buf = self.buffers[code] = SectorFlowBuffer(item.get("f14", code), self.capacity)
+                    self.names[item.get("f14", code)] = code
+                if buf.last_time() == ts:
+                    continue
+                buf.append(ts, item["f62"], item.get("f84") or 0.0, item.get("f3") or 0.0)
+
+    def sample(self):
         try:
-            if action == 'performance':
-                result = {"success": True, "data": fetch_sector_performance()}
-            elif action == 'funds':
-                code = params.get('code', [''])[0]
-                if code:
-                    result = {"success": True, "data": fetch_sector_funds(code)}
-                else:
-                    result = {"success": False, "message": "缺少板块代码"}
-            elif action == 'list':
-                result = {"success": True, "data": get_sector_list()}
-            else:
-                result = {"success": False, "message": f"未知操作: {action}"}
+            with upstream.priority(upstream.BACKGROUND):
+                self.record(fetch_sector_flow_raw())
         except Exception as e:
-            result = {"success": False, "message": str(e)}
-        
-        self._send_json(result)
-    
-    def do_POST(self):
-        self.do_GET()
+            print(f"采样板块资金流失败: {e}")
+
+    def start(self, interval=FLOW_SAMPLE_INTERVAL):
+        """启动后台采样线程（仅在长时间运行的服务器中调用）"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def loop():
+            while True:
+                self.sample()
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=loop, name="sector-flow-sampler", daemon=True)
+        self._thread.start()
+
+    def series(self, code=None, name=None, points=0, since=0):
+        """返回板块资金流与涨跌幅时间序列"""
+        with self.lock:
+            code = code or self.names.get(name)
+            buf = self.buffers.get(code)
+            if buf is None:
+                return None
+            cols = buf.columns
+            idx = [i for i in buf.indices() if cols["time"][i] > since]
+            idx = downsample_indices(idx, points)
+            return {
+                "code": code,
+                "name": buf.name,
+                "time": [int(cols["time"][i]) for i in idx],
+                "main_flow": [round(cols["main_flow"][i] / 100000000, 2) for i in idx],
+                "retail_flow": [round(cols["retail_flow"][i] / 100000000, 2) for i in idx],
+                "change_percent": [round(cols["change"][i], 2) for i in idx]
+            }
+
+
+flow_recorder = SectorFlowRecorder()
+
+
+def fetch_sector_flow_series(code=None, name=None, points=0, since=0):
+    """获取板块日内资金流时间序列"""
+    return flow_recorder.series(code=code, name=name, points=points, since=since)
+
+
+# ---- 路由（max_age 与 public/sw.js 中的 API_MAX_AGE 保持一致）----
+
+@router.action("sector", "performance", max_age=60, columns=())
+def _performance():
+    return {"success": True, "data": fetch_sector_performance()}
+
+
+@router.action("sector", "funds", Param("code", required=True, message="缺少板块代码"),
+               max_age=3600, columns=("type", "date"))
+def _funds(code):
+    return {"success": True, "data": fetch_sector_funds(code)}
+
+
+@router.action("sector", "list", max_age=86400)
+def _list():
+    return SECTOR_LIST_RESPONSE
+
+
+@router.action("sector", "flow_series", Param("code"), Param("name"), Param("points", int, 0),
+               Param("since", float, 0), max_age=30, long_running=True)
+def _flow_series(code, name, points, since):
+    if not code and not name:
+        return {"success": False, "message": "缺少板块代码"}
+    series = fetch_sector_flow_series(code, name, points, since)
+    if series:
+        return {"success": True, "data": series}
+    return {"success": False, "message": "暂无该板块采样数据"}
+
+
+class handler(ApiHandler):
+    endpoint = "sector"
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+性能基准脚本
+离线运行，不访问上游接口
+"""
+
+import gzip
+import json
+import os
+import subprocess
+import sys
+import timeit
+sys.path.insert(0, 'api')
+
+
+def report(name, seconds, number):
+    print(f"  - {name}: {seconds / number * 1e6:.1f} µs/次")
+
+
+# 在全新解释器中导入 handler 并处理一次请求，模拟 Vercel 冷启动
+COLD_START_CODE = r"""
+import io, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, 'api')
+module = __import__(sys.argv[1])
+t1 = time.perf_counter()
+h = module.handler.__new__(module.handler)
+h.path = sys.argv[2]
+h.command, h.request_version, h.requestline = 'GET', 'HTTP/1.1', 'GET ' + sys.argv[2]
+h.client_address, h.wfile = ('127.0.0.1', 0), io.BytesIO()
+h.log_message = lambda *args: None
+h.do_GET()
+t2 = time.perf_counter()
+print(f"{(t1 - t0) * 1000:.1f} {(t2 - t1) * 1000:.1f} {int('requests' in sys.modules)}")
+"""
+
+# 首个请求不访问上游（参数校验、未知操作、预编码常量）
+COLD_START_CASES = [
+    ("fund", "/api/fund?action=search&code=1"),
+    ("market", "/api/market?action=unknown"),
+    ("sector", "/api/sector?action=list"),
+]
+
+# 首个请求真正访问上游（回放存档），首个响应耗时包含延迟导入的 requests
+COLD_START_UPSTREAM_CASES = [
+    ("fund", "/api/fund?action=search&code=000217"),
+    ("market", "/api/market?action=indices"),
+]
+
+
+def measure_cold_start(module, path, runs=5):
+    """返回 (导入耗时 ms, 首个响应耗时 ms, 是否加载了 requests)，取多次运行的中位数"""
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", COLD_START_CODE, module, path],
+                             capture_output=True, text=True, check=True).stdout.split()
+        samples.append((float(out[0]), float(out[1]), out[2] == "1"))
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def make_sector_funds(rows=500):
+    """构造与 fetch_sector_funds 结构一致的 500 行基金数据"""
+    types = ["股票型", "混合型-偏股", "指数型-股票", "混合型-灵活", "QDII"]
+    return [{
+        "code": f"{i:06d}",
+        "name": f"测试主题混合发起式{i}",
+        "type": types[i % len(types)],
+        "date": "2024-05-20",
+        "nav_change": f"1.{i:04d}（{i % 7 - 3}.12%）",
+        "week_1": f"{i % 5}.21%",
+        "month_1": f"{i % 9 - 4}.35%",
+        "month_3": f"{i % 11}.02%",
+        "month_6": f"{i % 13 - 6}.77%",
+        "year_ytd": f"{i % 17}.40%",
+        "year_1": f"{i % 19 - 9}.18%",
+        "year_2": f"{i % 23}.95%",
+        "year_3": "---%",
+        "since_inception": f"{i * 3 % 200}.66%"
+    } for i in range(rows)]
+
+
+print("=" * 60)
+print("基金盯盘 PWA - 性能基准")
+print("=" * 60)
+
+# 基准 1: JSON 编码
+print("\n[基准 1] 500 行板块基金响应编码")
+print("-" * 40)
+import _codec
+payload = {"success": True, "data": make_sector_funds()}
+number = 200
+report("json.dumps(ensure_ascii=False)",
+       timeit.timeit(lambda: json.dumps(payload, ensure_ascii=False).encode('utf-8'), number=number), number)
+report("_codec 标准库回退", timeit.timeit(lambda: _codec._dumps_stdlib(payload), number=number), number)
+report(f"_codec.encode ({_codec.ENCODER})", timeit.timeit(lambda: _codec.encode(payload), number=number), number)
+print(f"  响应大小: {len(_codec.encode(payload))} 字节")
+
+# 基准 2: 静态响应
+print("\n[基准 2] 板块列表响应")
+print("-" * 40)
+from sector import get_sector_list, SECTOR_LIST_RESPONSE
+number = 5000
+report("每次构建并编码",
+       timeit.timeit(lambda: json.dumps({"success": True, "data": get_sector_list()}, ensure_ascii=False).encode('utf-8'),
+                     number=number), number)
+report("预编码", timeit.timeit(lambda: _codec.encode(SECTOR_LIST_RESPONSE), number=number), number)
+
+# 基准 3: 列式响应
+print("\n[基准 3] 500 行板块基金列式响应（layout=columns）")
+print("-" * 40)
+rows_body = _codec.encode(payload)
+table = _codec.to_columns(payload["data"], ("type", "date"))
+columns_body = _codec.encode({"success": True, "layout": "columns", "data": table})
+print(f"  行式: {len(rows_body)} 字节, gzip 后 {len(gzip.compress(rows_body))} 字节")
+print(f"  列式: {len(columns_body)} 字节, gzip 后 {len(gzip.compress(columns_body))} 字节")
+number = 200
+report("行式 编码+解码", timeit.timeit(lambda: json.loads(_codec.encode(payload)), number=number), number)
+report("列式 转换+编码+解码+还原", timeit.timeit(
+    lambda: _codec.from_columns(json.loads(_codec.encode(_codec.to_columns(payload["data"], ("type", "date"))))),
+    number=number), number)
+assert _codec.from_columns(table) == payload["data"]
+
+# 基准 4: 冷启动
+print("\n[基准 4] Serverless 冷启动")
+print("-" * 40)
+for module, path in COLD_START_CASES:
+    import_ms, first_ms, loaded = measure_cold_start(module, path)
+    print(f"  - {module}: 导入 {import_ms} ms, 首个响应 {first_ms} ms, requests {'已加载' if loaded else '未加载'}")
+if os.environ.get("FUND_UPSTREAM_MODE") == "replay":
+    for module, path in COLD_START_UPSTREAM_CASES:
+        import_ms, first_ms, loaded = measure_cold_start(module, path)
+        print(f"  - {module}（{path.split('action=')[1].split('&')[0]}，回放上游）: 导入 {import_ms} ms, "
+              f"首个响应 {first_ms} ms, requests {'已加载' if loaded else '未加载'}")
+else:
+    print("  ⚠️ 首个上游请求（含延迟导入）需以 FUND_UPSTREAM_MODE=replay 运行")
+
+# 基准 5: 提醒规则评估
+print("\n[基准 5] 提醒规则评估（300 只基金，30000 条规则）")
+print("-" * 40)
+import random
+from _alerts import AlertEngine, parse_metric
+rng = random.Random(42)
+engine = AlertEngine()
+codes = [f"{i:06d}" for i in range(300)]
+for _ in range(30000):
+    engine.add_rule(rng.choice(codes), "estimate_change", rng.choice(("lt", "gt")), round(rng.uniform(-5, 5), 2))
+updates = [{"code": rng.choice(codes), "estimate_change": f"{round(rng.gauss(0, 1.5), 2)}%"} for _ in range(20000)]
+
+
+def naive_scan():
+    """对照组：每次更新逐条检查该基金的全部规则"""
+    by_fund = {}
+    for r in engine.rules.values():
+        by_fund.setdefault(r["code"], []).append(r)
+    last = {}
+    for v in updates:
+        value = parse_metric(v["estimate_change"])
+        prev = last.get(v["code"])
+        last[v["code"]] = value
+        for r in by_fund.get(v["code"], []):
+            now_hit = value < r["threshold"] if r["op"] == "lt" else value > r["threshold"]
+            was_hit = prev is not None and (prev < r["threshold"] if r["op"] == "lt" else prev > r["threshold"])
+            if now_hit and not was_hit:
+                pass
+
+
+started = timeit.default_timer()
+fired = sum(len(engine.observe(v)) for v in updates)
+indexed = timeit.default_timer() - started
+started = timeit.default_timer()
+naive_scan()
+naive = timeit.default_timer() - started
+print(f"  - 有序阈值索引: {len(updates) / indexed:,.0f} 次更新/秒，触发 {fired} 条提醒")
+print(f"  - 逐条检查该基金规则: {len(updates) / naive:,.0f} 次更新/秒")
+
+# 基准 6: 回放上游存档
+print("\n[基准 6] 回放上游存档")
+print("-" * 40)
+from _transport import transport, REPLAY
+if transport.mode == REPLAY:
+    import time
+    from fund import search_fund, fetch_fund_valuation
+    from market import fetch_global_indices, fetch_volume_trend
+    from sector import fetch_sector_performance, fetch_sector_funds
+    fund_key = search_fund("000217").get("fund_key", "")
+    cases = [
+        ("fetch_fund_valuation", lambda: fetch_fund_valuation("000217", fund_key)),
+        ("fetch_global_indices", fetch_global_indices),
+        ("fetch_volume_trend", lambda: fetch_volume_trend(5)),
+        ("fetch_sector_performance", fetch_sector_performance),
+        ("fetch_sector_funds", lambda: fetch_sector_funds("BK000217")),
+    ]
+    for name, fn in cases:
+        started = time.perf_counter()
+        fn()
+        print(f"  - {name}: {(time.perf_counter() - started) * 1000:.1f} ms（{transport.timing}）")
+else:
+    print("  ⚠️ 跳过（先用 FUND_UPSTREAM_MODE=record python3 test_api.py 录制，"
+          "再以 FUND_UPSTREAM_MODE=replay 运行）")
+
+print("\n" + "=" * 60)
+print("基准完成")
+print("=" * 60)
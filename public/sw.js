@@ -1,5 +1,6 @@
-// Service Worker v2 - 优化缓存策略
-const CACHE_NAME = 'fund-pwa-v2';
+// Service Worker v3 - 静态资源缓存优先，API 按 action 过期后后台刷新
+const CACHE_NAME = 'fund-pwa-v3';
+const API_CACHE = 'fund-pwa-api-v2';
 const STATIC_ASSETS = [
   '/',
   '/index.html',
@@ -7,6 +8,14 @@ const STATIC_ASSETS = [
   '/icons/icon.svg'
 ];
 
+// API 各 action 的新鲜时间（秒），与服务端路由注册的 max_age 保持一致
+const API_MAX_AGE = {
+  '/api/market': { indices: 30, intraday: 30, volume: 600 },
+  '/api/sector': { performance: 60, list: 86400, funds: 3600, flow_series: 30 }
+};
+// 过期超过该倍数后不再先返回旧数据，而是等待网络（网络失败时仍回退旧数据）
+const API_STALE_FACTOR = 20;
+
 // 安装 - 预缓存静态资源
 self.addEventListener('install', event => {
   event.waitUntil(
@@ -21,7 +30,7 @@ self.addEventListener('activate', event => {
   event.waitUntil(
     caches.keys()
       .then(keys => Promise.all(
-        keys.filter(key => key !== CACHE_NAME).map(key => caches.delete(key))
+        keys.filter(key => key !== CACHE_NAME && key !== API_CACHE).map(key => caches.delete(key))
       ))
       .then(() => self.clients.claim())
   );
@@ -31,9 +40,14 @@ self.addEventListener('activate', event => {
 self.addEventListener('fetch', event => {
   const url = new URL(event.request.url);
   
-  // API 请求 - 网络优先，不缓存
+  // API 请求 - 可缓存的 action 过期后后台刷新，其余网络优先
   if (url.pathname.startsWith('/api/')) {
-    event.respondWith(fetch(event.request));
+    const maxAge = (API_MAX_AGE[url.pathname] || {})[url.searchParams.get('action')];
+    if (maxAge && event.request.method === 'GET') {
+      event.respondWith(staleWhileRevalidate(event, maxAge));
+    } else {
+      event.respondWith(fetch(event.request).catch(() => offlineResponse()));
+    }
     return;
   }
   
@@ -61,3 +75,55 @@ self.addEventListener('fetch', event => {
       })
   );
 });
+
+
+// 离线且无缓存时的兜底响应，与 API 错误格式一致
+function offlineResponse() {
+  return new Response(JSON.stringify({ success: false, offline: true, message: '网络不可用，暂无缓存数据' }), {
+    status: 503,
+    headers: { 'Content-Type': 'application/json; charset=utf-8' }
+  });
+}
+
+// 请求 API 并写入缓存，附带抓取时间用于判断新鲜度
+async function fetchAndCache(request) {
+  const response = await fetch(request);
+  // 与服务端 is_cacheable 一致：no-store 或 data 为空（上游失败）的响应不覆盖已有缓存
+  const noStore = (response.headers.get('Cache-Control') || '').includes('no-store');
+  if (response.ok && !noStore) {
+    const body = await response.clone().text();
+    let ok = false;
+    try {
+      const json = JSON.parse(body);
+      const data = json.data;
+      ok = json.success === true && data != null &&
+        !(Array.isArray(data) ? data.length === 0 : typeof data === 'object' && Object.keys(data).length === 0);
+    } catch (e) {}
+    if (ok) {
+      const headers = new Headers(response.headers);
+      headers.set('sw-fetched-at', String(Date.now()));
+      const cache = await caches.open(API_CACHE);
+      await cache.put(request, new Response(body, { status: 200, headers }));
+    }
+  }
+  return response;
+}
+
+async function staleWhileRevalidate(event, maxAge) {
+  const request = event.request;
+  const cached = await caches.match(request, { cacheName: API_CACHE });
+
+  if (cached) {
+    const age = (Date.now() - Number(cached.headers.get('sw-fetched-at') || 0)) / 1000;
+    if (age < maxAge) return cached;
+    const network = fetchAndCache(request);
+    if (age < maxAge * API_STALE_FACTOR) {
+      event.waitUntil(network.catch(() => {}));
+      return cached;
+    }
+    // 缓存过旧时优先用网络结果，但服务端繁忙（503/504）或失败时仍返回旧数据
+    return network.then(response => response.ok ? response : cached, () => cached);
+  }
+
+  return fetchAndCache(request).catch(() => offlineResponse());
+}
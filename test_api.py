@@ -109,6 +109,114 @@ try:
 except Exception as e:
     print(f"❌ 错误: {e}")
 
+# 测试 7: 增量估值（离线）
+print("\n[测试 7] 增量估值 batch_valuation since（离线）")
+print("-" * 40)
+try:
+    import fund as fund_module
+    rounds = [
+        [{"code": "000001", "estimate_change": "1.0%", "estimate_time": "10:00:00", "daily_change": "N/A"},
+         {"code": "000002", "estimate_change": "2.0%", "estimate_time": "10:00:00", "daily_change": "N/A"}],
+        [{"code": "000001", "estimate_change": "1.0%", "estimate_time": "10:00:00", "daily_change": "N/A"},
+         {"code": "000002", "estimate_change": "2.5%", "estimate_time": "10:01:00", "daily_change": "N/A"}],
+        [{"code": "000001", "estimate_change": "N/A", "estimate_time": "N/A", "daily_change": "N/A", "busy": True},
+         {"code": "000002", "estimate_change": "2.5%", "estimate_time": "10:01:00", "daily_change": "N/A"},
+         {"code": "000003", "estimate_change": "N/A", "estimate_time": "N/A", "daily_change": "N/A", "busy": True}],
+        [{"code": "000001", "estimate_change": "1.0%", "estimate_time": "10:00:00", "daily_change": "N/A"},
+         {"code": "000002", "estimate_change": "2.5%", "estimate_time": "10:01:00", "daily_change": "N/A"},
+         {"code": "000003", "estimate_change": "3.0%", "estimate_time": "10:02:00", "daily_change": "N/A"}],
+        [{"code": "000001", "estimate_change": "1.0%", "estimate_time": "10:00:00", "daily_change": "N/A"}],
+    ]
+    real_batch = fund_module.fetch_batch_valuation
+    fund_module.fetch_batch_valuation = lambda funds, fields=None: [dict(v) for v in rounds.pop(0)]
+    try:
+        delta = fund_module.fetch_batch_valuation_delta
+        r1 = delta([], "")
+        assert not r1["delta"] and len(r1["data"]) == 2, "首次请求应返回全量"
+        r2 = delta([], r1["version"])
+        assert r2["delta"] and [v["code"] for v in r2["data"]] == ["000002"], "只应返回变化的基金"
+        r3 = delta([], r2["version"])
+        assert [v["code"] for v in r3["data"]] == ["000003"], "busy 的已有基金不下发，新基金下发"
+        r4 = delta([], r3["version"])
+        assert [v["code"] for v in r4["data"]] == ["000003"], "busy 基金沿用上一版本的值"
+        r5 = delta([], "unknown")
+        assert not r5["delta"] and len(r5["data"]) == 1, "未知版本号应返回全量"
+    finally:
+        fund_module.fetch_batch_valuation = real_batch
+    print("✅ 增量估值测试通过")
+except Exception as e:
+    print(f"❌ 错误: {e}")
+
+# 测试 8: 估值曲线降采样（离线）
+print("\n[测试 8] 估值曲线 LTTB 降采样与增量缓存（离线）")
+print("-" * 40)
+try:
+    from fund import lttb, EstimateCurveCache
+    times = list(range(240))
+    values = [0.0] * 240
+    values[100] = 5.0
+    values[180] = -4.0
+    assert lttb(times, values, 0) == (times, values), "points=0 不降采样"
+    assert lttb(times[:10], values[:10], 20) == (times[:10], values[:10]), "点数不足时原样返回"
+    out_t, out_v = lttb(times, values, 24)
+    assert len(out_t) == len(out_v) == 24, "输出点数应等于 threshold"
+    assert out_t[0] == 0 and out_t[-1] == 239, "应保留首尾点"
+    assert out_t == sorted(set(out_t)), "时间应严格递增"
+    assert 5.0 in out_v and -4.0 in out_v, "应保留峰值与谷值"
+    assert lttb(times, values, 2) == ([0, 239], [0.0, 0.0]), "threshold<3 只保留首尾"
+    
+    curves = EstimateCurveCache(max_funds=2)
+    curves.update("K1", "2024-05-20", [{"time": 1000, "forecastGrowth": "0.01"}, {"time": 2000, "forecastGrowth": "0.02"}])
+    curves.update("K1", "2024-05-20", [{"time": 1000, "forecastGrowth": "0.01"}, {"time": 2000, "forecastGrowth": "0.02"},
+                                       {"time": 3000, "forecastGrowth": "0.03"}])
+    assert curves.get("K1", "2024-05-20") == ([1000, 2000, 3000], [1.0, 2.0, 3.0]), "只追加新点"
+    assert curves.get("K1", "2024-05-20", since=2000) == ([3000], [3.0]), "since 之后的点"
+    assert curves.get("K1", "2024-05-21") == ([], []), "跨交易日不复用"
+    curves.update("K2", "2024-05-20", [])
+    curves.update("K3", "2024-05-20", [])
+    assert curves.get("K1", "2024-05-20") == ([], []), "超过上限时淘汰最久未用的基金"
+    print("✅ 估值曲线测试通过")
+except Exception as e:
+    print(f"❌ 错误: {e}")
+
+# 测试 9: 阈值提醒（离线）
+print("\n[测试 9] 阈值提醒边沿触发（离线）")
+print("-" * 40)
+try:
+    from _alerts import AlertEngine, ThresholdIndex, OP_FUNCS
+    # 与逐条比较的结果对照，覆盖四种比较方式、阈值边界与 prev=None
+    thresholds = [-2.0, 0.0, 0.0, 2.0]
+    grid = [-3.0, -2.0, -1.0, 0.0, 1.0, 2.0, 3.0]
+    for op, check in OP_FUNCS.items():
+        index = ThresholdIndex(op)
+        for rule_id, t in enumerate(thresholds):
+            index.add(t, rule_id)
+        for prev in [None] + grid:
+            for value in grid:
+                expected = sorted(i for i, t in enumerate(thresholds)
+                                  if check(value, t) and not (prev is not None and check(prev, t)))
+                got = sorted(index.crossed(prev, value))
+                assert got == expected, f"{op} prev={prev} value={value}: {got} != {expected}"
+    
+    engine = AlertEngine()
+    engine.add_rule("000001", "estimate_change", "lt", -2)
+    fired = [len(engine.observe({"code": "000001", "estimate_change": v}))
+             for v in ("-1%", "-3%", "-4%", "N/A", "-1%", "-2.5%")]
+    assert fired == [0, 1, 0, 0, 0, 1], f"跨越后需回到阈值另一侧才再次触发: {fired}"
+    
+    engine = AlertEngine()
+    engine.add_rule("000002", "estimate_change", "gt", 5)
+    engine.observe({"code": "000002", "estimate_change": "-3%"})
+    cursor = engine.poll()["cursor"]
+    engine.add_rule("000002", "estimate_change", "lt", -2)
+    events = engine.poll(cursor)["events"]
+    assert len(events) == 1 and events[0]["value"] == -3.0, "新规则已满足条件时立即触发"
+    assert not engine.observe({"code": "000002", "estimate_change": "-3.1%"}), "已触发的规则不重复触发"
+    assert engine.remove_rule(events[0]["rule"]["id"]) and not engine.remove_rule(events[0]["rule"]["id"])
+    print("✅ 阈值提醒测试通过")
+except Exception as e:
+    print(f"❌ 错误: {e}")
+
 print("\n" + "=" * 60)
 print("测试完成")
 print("=" * 60)